@@ -0,0 +1,6 @@
+from botocore.config import Config
+
+# Client configuration shared by the deployment scripts: keep connections
+# alive between calls and back off adaptively on throttling. Kept free of
+# clients and logging setup so any script can import it.
+config = Config(tcp_keepalive=True, retries={'mode': 'adaptive', 'max_attempts': 5})
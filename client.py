@@ -1,12 +1,15 @@
 import boto3
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from aws_config import config
 
 # Set the AWS region
 region = 'us-west-2'
 
 # Initialize AWS clients
-s3_client = boto3.client('s3', region_name=region)
+# Enough pooled connections for the concurrent S3 calls in main()
+s3_client = boto3.client('s3', region_name=region, config=config.merge(Config(max_pool_connections=30)))
 
 # Initialize the logger
 logger = logging.getLogger()
@@ -16,6 +19,7 @@ logger.setLevel(logging.INFO)
 S3_BUCKET_NAME = 'lecture2-yaqundeng'
 OBJECT_KEY_1 = 'assignment1.txt'
 OBJECT_KEY_2 = 'assignment2.txt'
+WAITER_CONFIG = {'Delay': 1, 'MaxAttempts': 5}
 
 def create_object(key, content):
     """
@@ -58,23 +62,44 @@ def delete_object(key):
         logger.error("Error deleting object %s: %s", key, e)
         raise
 
-def main():
-    try:
-        # Step 1: Create object assignment1.txt
-        create_object(OBJECT_KEY_1, "Empty Assignment 1")
-        time.sleep(10)  # Sleep for 10 second
+def wait_for_object(key, exists=True):
+    """
+    Block until the object with the given key exists (or no longer exists) in S3.
 
-        # Step 2: Update object assignment1.txt
-        update_object(OBJECT_KEY_1, "Empty Assignment 1222222222")
-        time.sleep(10)  # Sleep for 10 second
+    :param key: The key of the object.
+    :param exists: Wait for the object to exist if True, to be gone if False.
+    """
+    waiter_name = 'object_exists' if exists else 'object_not_exists'
+    waiter = s3_client.get_waiter(waiter_name)
+    waiter.wait(Bucket=S3_BUCKET_NAME, Key=key, WaiterConfig=WAITER_CONFIG)
 
-        # Step 3: Delete object assignment1.txt
-        delete_object(OBJECT_KEY_1)
-        time.sleep(10)  # Sleep for 10 second
+def run_assignment1_lifecycle():
+    """
+    Create, update and delete assignment1.txt. These steps act on the same key
+    and must run in order.
+    """
+    # Step 1: Create object assignment1.txt
+    create_object(OBJECT_KEY_1, "Empty Assignment 1")
+    wait_for_object(OBJECT_KEY_1)
+
+    # Step 2: Update object assignment1.txt
+    update_object(OBJECT_KEY_1, "Empty Assignment 1222222222")
+    wait_for_object(OBJECT_KEY_1)
+
+    # Step 3: Delete object assignment1.txt
+    delete_object(OBJECT_KEY_1)
+    wait_for_object(OBJECT_KEY_1, exists=False)
 
-        # Step 4: Create object assignment2.txt
-        create_object(OBJECT_KEY_2, "Empty Assignment 2")
-        time.sleep(10)  # Sleep for 10 second
+def main():
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(run_assignment1_lifecycle),
+                # Step 4: Create object assignment2.txt, independent of assignment1.txt
+                executor.submit(create_object, OBJECT_KEY_2, "Empty Assignment 2"),
+            ]
+            for future in futures:
+                future.result()
 
     except Exception as e:
         logger.error("Error in main execution: %s", e)
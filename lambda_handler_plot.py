@@ -1,16 +1,31 @@
 import boto3
 import json
 import logging
+import os
+
+# Lambda only allows writes to /tmp, so keep the Matplotlib font cache there
+os.environ.setdefault('MPLCONFIGDIR', '/tmp')
+
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend, skips GUI backend probing
 import matplotlib.pyplot as plt
+import numpy as np
 from io import BytesIO
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Set the AWS region
 region = 'us-west-2'
 
+# Keep connections alive across warm invocations
+config = Config(tcp_keepalive=True)
+
 # Initialize AWS clients
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb', region_name=region)
+s3_client = boto3.client('s3', config=config)
+dynamodb_client = boto3.client('dynamodb', region_name=region, config=config)
+
+# Create the figure once so warm invocations can reuse it
+FIG, AX = plt.subplots(figsize=(10, 6))
 
 # Initialize the logger
 logger = logging.getLogger()
@@ -23,20 +38,28 @@ PLOT_KEY = 'plot.png'
 
 def lambda_handler(event, context):
     try:
-        logger.info("Received event: %s", json.dumps(event))
-        # Fetch items from DynamoDB
-        items = fetch_dynamodb_items()
+        logger.info("Received event: %s", event)
+        # Fetch the most recent item from DynamoDB
+        latest_item = fetch_latest_item()
 
-        if not items:
+        if latest_item is None:
             logger.warning("No data found in DynamoDB table.")
             return {
                 'statusCode': 404,
                 'body': 'No data found in DynamoDB table'
             }
 
-        # Generate plot
-        plot_url = generate_plot(items)
-        logger.info("Plot generated and saved to S3: %s", plot_url)
+        if get_cached_plot_item() == latest_item:
+            # Nothing was recorded since the plot was generated, reuse it
+            plot_url = f"s3://{S3_BUCKET_NAME}/{PLOT_KEY}"
+            logger.info("Plot in S3 is up to date: %s", plot_url)
+        else:
+            # Fetch items from DynamoDB
+            items = fetch_dynamodb_items()
+
+            # Generate plot
+            plot_url = generate_plot(items)
+            logger.info("Plot generated and saved to S3: %s", plot_url)
 
         return {
             'statusCode': 200,
@@ -56,28 +79,73 @@ def lambda_handler(event, context):
             'body': json.dumps('Internal Server Error')
         }
 
-def fetch_dynamodb_items():
+def fetch_latest_item():
     """
-    Retrieve all items from DynamoDB table and sort them by timestamp.
+    Retrieve the most recent item of the bucket from DynamoDB.
 
-    :return: List of items from DynamoDB.
+    :return: The (timestamp, total size) tuple of the item, or None if there is none.
     """
     try:
-        table = dynamodb.Table(DYNAMODB_TABLE_NAME)
-        response = table.scan()
-        items = response['Items']
+        response = dynamodb_client.query(
+            TableName=DYNAMODB_TABLE_NAME,
+            KeyConditionExpression='S3ObjectKey = :bucket',
+            ExpressionAttributeValues={':bucket': {'S': S3_BUCKET_NAME}},
+            ProjectionExpression='#ts, total_size',
+            ExpressionAttributeNames={'#ts': 'Timestamp'},
+            ScanIndexForward=False,
+            Limit=1
+        )
+        if not response['Items']:
+            return None
+        item = response['Items'][0]
+        return int(item['Timestamp']['N']), int(item['total_size']['N'])
+    except ClientError as e:
+        logger.error("Error fetching latest item from DynamoDB: %s", e)
+        raise e
 
-        logger.info("Fetched %d items from DynamoDB.", len(items))
+def get_cached_plot_item():
+    """
+    Read which item the plot stored in S3 was last generated up to.
 
-        # Paginate through results if necessary
-        while 'LastEvaluatedKey' in response:
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-            items.extend(response['Items'])
-            logger.info("Fetched additional items from DynamoDB, total count: %d.", len(items))
+    :return: The (timestamp, total size) tuple of the last plotted item, or None if
+             there is no plot yet.
+    """
+    try:
+        head = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=PLOT_KEY)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return None
+        logger.error("Error reading plot metadata from S3: %s", e)
+        raise e
 
-        # Sort items by timestamp
-        items.sort(key=lambda x: x['Timestamp'])
-        logger.info("Sorted items by timestamp.")
+    metadata = head['Metadata']
+    if 'last-ts' not in metadata or 'last-size' not in metadata:
+        return None
+    return int(metadata['last-ts']), int(metadata['last-size'])
+
+def fetch_dynamodb_items():
+    """
+    Retrieve the history of the bucket from DynamoDB, ordered by timestamp. Only
+    the attributes used by the plot are read from the raw response.
+
+    :return: List of (timestamp, total size) tuples.
+    """
+    try:
+        paginator = dynamodb_client.get_paginator('query')
+        pages = paginator.paginate(
+            TableName=DYNAMODB_TABLE_NAME,
+            KeyConditionExpression='S3ObjectKey = :bucket',
+            ExpressionAttributeValues={':bucket': {'S': S3_BUCKET_NAME}},
+            # Only fetch what the plot uses; Timestamp is a reserved word, hence the alias
+            ProjectionExpression='#ts, total_size',
+            ExpressionAttributeNames={'#ts': 'Timestamp'},
+            ScanIndexForward=True  # Items come back sorted by the Timestamp sort key
+        )
+
+        items = []
+        for page in pages:
+            items.extend((int(item['Timestamp']['N']), int(item['total_size']['N'])) for item in page['Items'])
+            logger.info("Fetched items from DynamoDB, total count: %d.", len(items))
 
         return items
     except ClientError as e:
@@ -88,30 +156,29 @@ def generate_plot(items):
     """
     Generate a line chart plot based on DynamoDB items and save it to S3.
 
-    :param items: List of items fetched from DynamoDB.
+    :param items: List of (timestamp, total size) tuples fetched from DynamoDB.
     :return: URL of the generated plot in S3.
     """
     try:
-        timestamps = [item['Timestamp'] for item in items]
-        total_sizes = [item['total_size'] for item in items]
+        timestamps, total_sizes = np.array(items, dtype=np.int64).T
 
-        # Create line chart plot
-        plt.figure(figsize=(10, 6))
-        plt.plot(timestamps, total_sizes, marker='o', linestyle='-', color='b')
-        plt.xlabel('Timestamp')
-        plt.ylabel('Total Object Size')
-        plt.title('Total Object Size Over Time')
-        plt.grid(True)
+        # Create line chart plot on the shared figure
+        AX.clear()
+        AX.plot(timestamps, total_sizes, marker='o', linestyle='-', color='b')
+        AX.set_xlabel('Timestamp')
+        AX.set_ylabel('Total Object Size')
+        AX.set_title('Total Object Size Over Time')
+        AX.grid(True)
 
         # Save plot to a buffer
         buffer = BytesIO()
-        plt.savefig(buffer, format='png')
+        FIG.savefig(buffer, format='png')
         buffer.seek(0)
 
         logger.info("Generated plot and saved to buffer.")
 
-        # Upload plot to S3 bucket
-        upload_plot_to_s3(buffer)
+        # Upload plot to S3 bucket, recording the last plotted item
+        upload_plot_to_s3(buffer, items[-1])
 
         # Return URL to the generated plot
         plot_url = f"s3://{S3_BUCKET_NAME}/{PLOT_KEY}"
@@ -122,14 +189,23 @@ def generate_plot(items):
         logger.error("Error generating plot: %s", e)
         raise e
 
-def upload_plot_to_s3(buffer):
+def upload_plot_to_s3(buffer, last_item):
     """
     Upload the plot image to S3 bucket.
 
     :param buffer: BytesIO object containing the plot image.
+    :param last_item: The (timestamp, total size) tuple of the last plotted item,
+                      stored in the object metadata.
     """
+    last_ts, last_size = last_item
     try:
-        s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=PLOT_KEY, Body=buffer, ContentType='image/png')
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=PLOT_KEY,
+            Body=buffer,
+            ContentType='image/png',
+            Metadata={'last-ts': str(last_ts), 'last-size': str(last_size)}
+        )
         logger.info("Plot image saved to S3 bucket: s3://%s/%s", S3_BUCKET_NAME, PLOT_KEY)
     except ClientError as e:
         logger.error("Error uploading plot to S3: %s", e)
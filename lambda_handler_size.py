@@ -1,92 +1,419 @@
 import boto3
 import logging
+import os
+import string
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Initialize the logger
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Enough connections for the parallel listing, kept alive across warm invocations
+config = Config(max_pool_connections=64, tcp_keepalive=True, retries={'mode': 'adaptive'})
+
 # Initialize AWS clients
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+s3_client = boto3.client('s3', config=config)
+dynamodb = boto3.resource('dynamodb', config=config)
 
 # Define the DynamoDB table name
 DYNAMODB_TABLE_NAME = 'S3-object-size-history'
 
+# Key boundaries used to split the bucket listing into ranges that are listed in parallel
+LIST_BOUNDARIES = sorted(string.digits + string.ascii_letters + '-_.')
+LIST_WORKERS = 32
+
+# Bookkeeping items live outside the bucket's history partition, under this sort key
+TRACKING_TIMESTAMP = 0
+RUNNING_TOTAL_SUFFIX = '#total'
+
+RECONCILE_LOCK_SUFFIX = '#reconcile'
+
+# How often a record is retried when it conflicts with a concurrent update
+TRANSACTION_ATTEMPTS = 3
+
+# A reconcile lock older than the longest Lambda run is left over from a crash
+RECONCILE_LOCK_SECONDS = 900
+
+# Written by the plot Lambda into the tracked bucket; it isn't part of the tracked
+# data, and counting it would make every plot regeneration add a history row
+PLOT_KEY = 'plot.png'
+
 def lambda_handler(event, context):
     try:
-        logger.info(f"Event: {event}")
-        # Extract the bucket name from the event
-        bucket_name = event['Records'][0]['s3']['bucket']['name']
-        
-        # Calculate the total size of all objects in the bucket
-        total_size, object_count = calculate_total_size(bucket_name)
-        
-        logger.info(f"total_size, object_count: {total_size}, {object_count}")
-        
+        logger.info("Event: %s", event)
         # Get the current timestamp
-        timestamp = int(datetime.utcnow().timestamp())
+        timestamp = int(time.time())
+
+        rows = []
+        if 'Records' in event:
+            # S3 may deliver several records in one event, group them by bucket
+            records_by_bucket = {}
+            for record in event['Records']:
+                if unquote_plus(record['s3']['object']['key']) == PLOT_KEY:
+                    continue
+                records_by_bucket.setdefault(record['s3']['bucket']['name'], []).append(record)
+
+            # Apply the size changes of the event to the running totals
+            for bucket_name, records in records_by_bucket.items():
+                totals = apply_event_records(bucket_name, records)
+                if totals is not None:
+                    total_size, object_count = totals
+                    rows.append((bucket_name, timestamp, object_count, total_size))
+        elif event.get('reconcile'):
+            # Scheduled recount of the bucket that resets the running total
+            bucket_name = os.environ['BUCKET_NAME']
+            totals = recount(bucket_name)
+            if totals is not None:
+                total_size, object_count = totals
+                rows.append((bucket_name, timestamp, object_count, total_size))
+        else:
+            logger.warning("Ignoring event that is neither an S3 notification nor a reconcile.")
+        
+        logger.info("Rows to write: %s", rows)
         
         # Write to the DynamoDB table
-        write_to_dynamodb(bucket_name, timestamp, object_count, total_size)
+        write_to_dynamodb(rows)
         
-        logger.info(f"Successfully processed event for bucket {bucket_name}.")
+        logger.info("Successfully processed event for %d bucket(s).", len(rows))
         
         # return {
         #     'statusCode': 200,
         #     'body': json.dumps('Hello from Lambda!')
         # }
     except Exception as e:
-        logger.error(f"Error processing event: {str(e)}")
+        logger.error("Error processing event: %s", e)
         raise
 
-def calculate_total_size(bucket_name):
+def list_key_range(bucket_name, start_after, end_at):
+    """
+    List the objects whose keys fall in the range (start_after, end_at].
+
+    :param bucket_name: The name of the S3 bucket.
+    :param start_after: Exclusive lower bound of the range, or None for no bound.
+    :param end_at: Inclusive upper bound of the range, or None for no bound.
+    :return: List of (key, size) tuples.
+    """
+    objects = []
+
+    paginate_kwargs = {'Bucket': bucket_name}
+    if start_after is not None:
+        paginate_kwargs['StartAfter'] = start_after
+
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(**paginate_kwargs):
+        for obj in page.get('Contents', []):
+            # Keys are listed in order, so everything from here on is in the next range
+            if end_at is not None and obj['Key'] > end_at:
+                return objects
+            objects.append((obj['Key'], obj['Size']))
+
+    return objects
+
+def list_bucket_objects(bucket_name):
+    """
+    List all objects in the given S3 bucket, except the plot. The first page is
+    listed directly; only when the bucket has more keys is the rest listed in
+    parallel key ranges.
+
+    :param bucket_name: The name of the S3 bucket.
+    :return: List of (key, size) tuples.
+    """
+    response = s3_client.list_objects_v2(Bucket=bucket_name)
+    objects = [(obj['Key'], obj['Size']) for obj in response.get('Contents', [])]
+
+    if response['IsTruncated']:
+        # Consecutive boundaries after the first page give ranges that together
+        # cover every remaining key exactly once
+        last_key = objects[-1][0]
+        boundaries = [boundary for boundary in LIST_BOUNDARIES if boundary > last_key]
+        starts = [last_key] + boundaries
+        ends = boundaries + [None]
+
+        with ThreadPoolExecutor(max_workers=LIST_WORKERS) as executor:
+            futures = [executor.submit(list_key_range, bucket_name, start, end) for start, end in zip(starts, ends)]
+            for future in futures:
+                objects.extend(future.result())
+
+    return [(key, size) for key, size in objects if key != PLOT_KEY]
+
+def calculate_total_size(bucket_name, objects):
     """
-    Calculate the total size of all objects in the given S3 bucket.
+    Calculate the total size of the listed objects of the given S3 bucket.
 
     :param bucket_name: The name of the S3 bucket.
+    :param objects: The (key, size) tuples listed from the bucket.
     :return: A tuple containing the total size in bytes and the number of objects.
     """
-    total_size = 0
-    object_count = 0
+    total_size = sum(size for _, size in objects)
+    object_count = len(objects)
+    logger.info("Bucket %s contains %s objects with a total size of %s bytes.", bucket_name, object_count, total_size)
+
+    return total_size, object_count
+
+def tracking_key(bucket_name, object_key):
+    """Key of the item that tracks the size of an object."""
+    return {'S3ObjectKey': f"{bucket_name}/{object_key}", 'Timestamp': TRACKING_TIMESTAMP}
+
+def running_total_key(bucket_name):
+    """Key of the item that holds the running total of a bucket."""
+    return {'S3ObjectKey': bucket_name + RUNNING_TOTAL_SUFFIX, 'Timestamp': TRACKING_TIMESTAMP}
+
+def reconcile_lock_key(bucket_name):
+    """Key of the item that makes sure only one recount of a bucket runs at a time."""
+    return {'S3ObjectKey': bucket_name + RECONCILE_LOCK_SUFFIX, 'Timestamp': TRACKING_TIMESTAMP}
+
+def is_later(sequencer, other):
+    """
+    Tell whether an S3 event sequencer comes after another one for the same key.
+    Sequencers are hex strings of varying length, compared after right-padding the
+    shorter one with zeros.
+    """
+    width = max(len(sequencer), len(other))
+    return sequencer.ljust(width, '0') > other.ljust(width, '0')
+
+def apply_event_record(bucket_name, record):
+    """
+    Apply the size change of an S3 event record to the running total of the bucket.
+
+    The size of every object is tracked in the DynamoDB table, so overwrites and
+    deletions can be accounted for. Deleted objects keep a tombstone, and the
+    sequencer of the last applied event is stored on the tracking item, so events
+    delivered late or twice are ignored. The tracking item and the running total
+    are written in one transaction, conditional on the tracking item being unchanged
+    since it was read and on no recount having happened in between.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param record: A record from the S3 event.
+    :return: False if there is no running total yet, True otherwise.
+    """
+    client = dynamodb.meta.client
+    event_name = record['eventName']
+    s3_object = record['s3']['object']
+    object_key = unquote_plus(s3_object['key'])
+    sequencer = s3_object.get('sequencer')
+    object_tracking_key = tracking_key(bucket_name, object_key)
+    total_key = running_total_key(bucket_name)
+
+    if not event_name.startswith(('ObjectCreated:', 'ObjectRemoved:')):
+        # Other events, e.g. restores, don't change the bucket contents
+        return True
+
+    for attempt in range(TRANSACTION_ATTEMPTS):
+        response = client.transact_get_items(
+            TransactItems=[
+                {'Get': {'TableName': DYNAMODB_TABLE_NAME, 'Key': total_key}},
+                {'Get': {'TableName': DYNAMODB_TABLE_NAME, 'Key': object_tracking_key}}
+            ]
+        )
+        total, tracked = (item.get('Item') for item in response['Responses'])
+        if total is None or 'generation' not in total:
+            return False
+        generation = total['generation']
+
+        if tracked is None:
+            tracking_condition = {'ConditionExpression': 'attribute_not_exists(S3ObjectKey)'}
+        else:
+            if sequencer and 'sequencer' in tracked and not is_later(sequencer, tracked['sequencer']):
+                logger.info("Skipping out of order or repeated event %s for %s.", event_name, object_key)
+                return True
+            if 'sequencer' in tracked:
+                tracking_condition = {
+                    'ConditionExpression': 'generation = :old_generation AND sequencer = :old_sequencer',
+                    'ExpressionAttributeValues': {
+                        ':old_generation': tracked['generation'],
+                        ':old_sequencer': tracked['sequencer']
+                    }
+                }
+            else:
+                tracking_condition = {
+                    'ConditionExpression': 'generation = :old_generation AND attribute_not_exists(sequencer)',
+                    'ExpressionAttributeValues': {':old_generation': tracked['generation']}
+                }
+
+        # Objects tracked before the last recount and not seen by it are gone
+        exists = tracked is not None and tracked['generation'] == generation and not tracked.get('deleted', False)
+        previous_size = int(tracked['size']) if exists else 0
 
+        if event_name.startswith('ObjectCreated:'):
+            size = s3_object['size']
+            size_delta, count_delta = size - previous_size, 0 if exists else 1
+        else:
+            size = 0
+            size_delta, count_delta = -previous_size, -1 if exists else 0
+
+        tracking_item = {**object_tracking_key, 'size': size, 'generation': generation,
+                         'deleted': event_name.startswith('ObjectRemoved:')}
+        if sequencer:
+            tracking_item['sequencer'] = sequencer
+
+        try:
+            client.transact_write_items(
+                TransactItems=[
+                    {'Put': {'TableName': DYNAMODB_TABLE_NAME, 'Item': tracking_item, **tracking_condition}},
+                    {'Update': {
+                        'TableName': DYNAMODB_TABLE_NAME,
+                        'Key': total_key,
+                        'UpdateExpression': 'ADD total_size :size_delta, object_count :count_delta',
+                        'ConditionExpression': 'generation = :generation',
+                        'ExpressionAttributeValues': {
+                            ':size_delta': size_delta,
+                            ':count_delta': count_delta,
+                            ':generation': generation
+                        }
+                    }}
+                ]
+            )
+            return True
+        except ClientError as e:
+            # Retry when the same object or a recount changed things in between;
+            # give up after the last attempt so Lambda retries the whole event
+            if e.response['Error']['Code'] != 'TransactionCanceledException' or attempt == TRANSACTION_ATTEMPTS - 1:
+                raise
+            logger.info("Concurrent update of %s in bucket %s, retrying.", object_key, bucket_name)
+
+def get_running_total(bucket_name):
+    """
+    Read the running total of the bucket.
+
+    :param bucket_name: The name of the S3 bucket.
+    :return: A tuple containing the total size in bytes and the number of objects.
+    """
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    item = table.get_item(Key=running_total_key(bucket_name), ConsistentRead=True)['Item']
+    return int(item['total_size']), int(item['object_count'])
+
+def apply_event_records(bucket_name, records):
+    """
+    Update the running total of the bucket with the changes in the event records.
+
+    :param bucket_name: The name of the S3 bucket.
+    :param records: The records of the S3 event.
+    :return: A tuple containing the total size in bytes and the number of objects,
+             or None if the bucket has no running total yet.
+    """
     try:
-        paginator = s3_client.get_paginator('list_objects_v2')
-        for page in paginator.paginate(Bucket=bucket_name):
-            for obj in page.get('Contents', []):
-                total_size += obj['Size']
-                object_count += 1
-        
-        logger.info(f"Bucket {bucket_name} contains {object_count} objects with a total size of {total_size} bytes.")
+        for record in records:
+            if not apply_event_record(bucket_name, record):
+                logger.warning("No running total for bucket %s yet, waiting for the next reconcile.", bucket_name)
+                return None
+
+        return get_running_total(bucket_name)
     except ClientError as e:
-        logger.error(f"Error calculating total size of bucket {bucket_name}: {str(e)}")
+        logger.error("Error applying event to running total of bucket %s: %s", bucket_name, e)
         raise
 
-    return total_size, object_count
+def acquire_reconcile_lock(bucket_name, token):
+    """
+    Take the reconcile lock of the bucket, unless another recount holds it.
 
-def write_to_dynamodb(bucket_name, timestamp, object_count, total_size):
+    :param bucket_name: The name of the S3 bucket.
+    :param token: Identifies the lock holder.
+    :return: Whether the lock was taken.
     """
-    Write the provided information to the DynamoDB table.
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    now = int(time.time())
+    try:
+        table.put_item(
+            Item={**reconcile_lock_key(bucket_name), 'lock_token': token, 'expires_at': now + RECONCILE_LOCK_SECONDS},
+            ConditionExpression='attribute_not_exists(S3ObjectKey) OR expires_at < :now',
+            ExpressionAttributeValues={':now': now}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def release_reconcile_lock(bucket_name, token):
+    """
+    Release the reconcile lock of the bucket if it is still held with the token.
 
     :param bucket_name: The name of the S3 bucket.
-    :param timestamp: The current timestamp.
-    :param object_count: The number of objects in the bucket.
-    :param total_size: The total size of the objects in the bucket in bytes.
+    :param token: Identifies the lock holder.
     """
     table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    try:
+        table.delete_item(
+            Key=reconcile_lock_key(bucket_name),
+            ConditionExpression='lock_token = :token',
+            ExpressionAttributeValues={':token': token}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def recount(bucket_name):
+    """
+    Count the whole bucket and reset its running total to the result. Every
+    object is tracked again under a new generation, which makes the tracking
+    items of earlier generations stale. Only one recount of a bucket runs at a
+    time; this writes one item per object, so it only runs on the scheduled
+    reconcile and never on the event path.
+
+    :param bucket_name: The name of the S3 bucket.
+    :return: A tuple containing the total size in bytes and the number of objects,
+             or None if another recount is running.
+    """
+    generation = time.time_ns()
+    if not acquire_reconcile_lock(bucket_name, generation):
+        logger.warning("Another recount of bucket %s is running, skipping.", bucket_name)
+        return None
 
     try:
+        objects = list_bucket_objects(bucket_name)
+        total_size, object_count = calculate_total_size(bucket_name, objects)
+
+        table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+        for object_key, size in objects:
+            # Keep the stored sequencer, so older events still get ignored
+            table.update_item(
+                Key=tracking_key(bucket_name, object_key),
+                UpdateExpression='SET #size = :size, generation = :generation, deleted = :deleted',
+                ExpressionAttributeNames={'#size': 'size'},
+                ExpressionAttributeValues={':size': size, ':generation': generation, ':deleted': False}
+            )
+
+        # Written last, so events only switch to the new generation once every object is tracked
         table.put_item(
             Item={
-                'S3ObjectKey': bucket_name,  # Use bucket name as the partition key
-                'Timestamp': timestamp,  # Use timestamp as the sort key
+                **running_total_key(bucket_name),
+                'generation': generation,
                 'object_count': object_count,
                 'total_size': total_size
             }
         )
-        logger.info(f"Successfully wrote to DynamoDB: {bucket_name}, {timestamp}, {object_count}, {total_size}.")
+        logger.info("Reset running total of bucket %s.", bucket_name)
+    finally:
+        release_reconcile_lock(bucket_name, generation)
+
+    return total_size, object_count
+
+def write_to_dynamodb(rows):
+    """
+    Write the provided information to the DynamoDB table in a single batch.
+
+    :param rows: List of tuples containing the name of the S3 bucket, the current
+                 timestamp, the number of objects in the bucket and the total size
+                 of the objects in the bucket in bytes.
+    """
+    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+
+    try:
+        with table.batch_writer() as batch:
+            for bucket_name, timestamp, object_count, total_size in rows:
+                batch.put_item(
+                    Item={
+                        'S3ObjectKey': bucket_name,  # Use bucket name as the partition key
+                        'Timestamp': timestamp,  # Use timestamp as the sort key
+                        'object_count': object_count,
+                        'total_size': total_size
+                    }
+                )
+        logger.info("Successfully wrote %d item(s) to DynamoDB: %s.", len(rows), rows)
     except ClientError as e:
-        logger.error(f"Error writing to DynamoDB: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error("Error writing to DynamoDB: %s", e)
+        raise
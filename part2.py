@@ -5,16 +5,19 @@ import zipfile
 import io
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
+from aws_config import config
 
 # Set the AWS region
 region = 'us-west-2'
 
 # Initialize AWS clients
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb', region_name=region)
-iam = boto3.client('iam')
-lambda_client = boto3.client('lambda', region_name=region)
+s3_client = boto3.client('s3', config=config)
+dynamodb = boto3.resource('dynamodb', region_name=region, config=config)
+iam = boto3.client('iam', config=config)
+lambda_client = boto3.client('lambda', region_name=region, config=config)
+events_client = boto3.client('events', region_name=region, config=config)
 
 # Define the DynamoDB table name
 DYNAMODB_TABLE_NAME = 'S3-object-size-history'
@@ -24,11 +27,9 @@ logging.basicConfig(level=logging.INFO)
 
 def progress_bar(seconds):
     """Shows a simple progress bar in the command window."""
-    for _ in range(seconds):
-        time.sleep(1)
-        print(".", end="")
-        sys.stdout.flush()
-    print()
+    print("." * seconds)
+    sys.stdout.flush()
+    time.sleep(seconds)
 
 def create_iam_role_for_lambda(iam_role_name):
     """
@@ -74,7 +75,7 @@ def create_iam_role_for_lambda(iam_role_name):
             )
             raise
 
-    for policy_arn in policies:
+    def attach_policy(policy_arn):
         try:
             iam.attach_role_policy(
                 RoleName=iam_role_name,
@@ -85,6 +86,10 @@ def create_iam_role_for_lambda(iam_role_name):
             logger.exception("Couldn't attach policy %s to role %s.", policy_arn, iam_role_name)
             raise
 
+    # The attachments are independent, so issue them concurrently
+    with ThreadPoolExecutor(max_workers=len(policies)) as executor:
+        list(executor.map(attach_policy, policies))
+
     return role['Role']['Arn']
 
 def create_deployment_package(source_file):
@@ -97,12 +102,36 @@ def create_deployment_package(source_file):
     :return: The deployment package.
     """
     buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, "w") as zipped:
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zipped:
         zipped.write(source_file)
     buffer.seek(0)
     return buffer.read()
 
-def create_function(function_name, handler_name, iam_role_arn, deployment_package):
+def create_function_when_role_ready(delays=(0.5, 1, 2, 4, 8, 16), **kwargs):
+    """
+    Calls Lambda CreateFunction, retrying with backoff while the execution role
+    can't be assumed by Lambda yet because IAM is still propagating it.
+
+    :param delays: The seconds to sleep after each failed attempt.
+    :param kwargs: The arguments passed to CreateFunction.
+    :return: The CreateFunction response.
+    """
+    for delay in delays:
+        try:
+            return lambda_client.create_function(**kwargs)
+        except ClientError as error:
+            # Lambda uses this code for other misconfigurations too, only retry
+            # while the role can't be assumed yet
+            if (error.response["Error"]["Code"] != "InvalidParameterValueException"
+                    or "cannot be assumed" not in error.response["Error"]["Message"]):
+                raise
+            logger.info("Role %s isn't ready yet, retrying in %s seconds.", kwargs["Role"], delay)
+            time.sleep(delay)
+
+    # Last attempt, let the error propagate if the role still isn't ready
+    return lambda_client.create_function(**kwargs)
+
+def create_function(function_name, handler_name, iam_role_arn, deployment_package, timeout=30):
     """
     Deploys a Lambda function.
 
@@ -112,10 +141,11 @@ def create_function(function_name, handler_name, iam_role_arn, deployment_packag
     :param iam_role_arn: The IAM role to use for the function.
     :param deployment_package: The deployment package that contains the function
                                code in .zip format.
+    :param timeout: The number of seconds the function may run.
     :return: The Amazon Resource Name (ARN) of the newly created function.
     """
     try:
-        response = lambda_client.create_function(
+        response = create_function_when_role_ready(
             FunctionName=function_name,
             Description="Process S3 events and update DynamoDB",
             Runtime="python3.12",
@@ -128,7 +158,7 @@ def create_function(function_name, handler_name, iam_role_arn, deployment_packag
                     'TABLE_NAME': DYNAMODB_TABLE_NAME
                 }
             },
-            Timeout=30,
+            Timeout=timeout,
             MemorySize=128,
             Publish=True,
         )
@@ -173,9 +203,50 @@ def configure_s3_trigger(function_arn, bucket_name):
                 ]
             }
         )
-        logger.info(f"S3 trigger configured for Lambda function '{function_arn}'.")
+        logger.info("S3 trigger configured for Lambda function '%s'.", function_arn)
+    except ClientError:
+        logger.exception("Couldn't configure S3 trigger for function %s.", function_arn)
+        raise
+
+def schedule_reconcile(function_arn, rule_name):
+    """
+    Schedule a daily reconcile of the running bucket total, and run the first one
+    right away so the running total exists before S3 events are applied to it.
+
+    :param function_arn: The ARN of the size tracking Lambda function.
+    :param rule_name: The name of the EventBridge rule.
+    """
+    try:
+        rule = events_client.put_rule(
+            Name=rule_name,
+            ScheduleExpression='rate(1 day)',
+            Description='Recount the tracked S3 bucket and reset its running total'
+        )
+        lambda_client.add_permission(
+            FunctionName=function_arn,
+            StatementId='reconcile-schedule',
+            Action='lambda:InvokeFunction',
+            Principal='events.amazonaws.com',
+            SourceArn=rule['RuleArn']
+        )
+        events_client.put_targets(
+            Rule=rule_name,
+            Targets=[
+                {
+                    'Id': 'reconcile',
+                    'Arn': function_arn,
+                    'Input': json.dumps({'reconcile': True})
+                }
+            ]
+        )
+        lambda_client.invoke(
+            FunctionName=function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({'reconcile': True})
+        )
+        logger.info("Scheduled daily reconcile for Lambda function '%s'.", function_arn)
     except ClientError:
-        logger.exception(f"Couldn't configure S3 trigger for function {function_arn}.")
+        logger.exception("Couldn't schedule reconcile for function %s.", function_arn)
         raise
 
 def main():
@@ -183,9 +254,6 @@ def main():
     role_name = 'lambda-s3-dynamodb-role'
     role_arn = create_iam_role_for_lambda(role_name)
 
-    print("Creating lambda role", end="")
-    progress_bar(5)
-
     # Lambda Function
     function_name = 'S3ObjectSizeTracker'
     source_file = 'lambda_handler_size.py'
@@ -195,7 +263,8 @@ def main():
     progress_bar(5)
 
     handler_name = 'lambda_handler_size.lambda_handler'
-    function_arn = create_function(function_name, handler_name, role_arn, zip_file)
+    # The reconcile lists the bucket and tracks every object, so allow the longest run
+    function_arn = create_function(function_name, handler_name, role_arn, zip_file, timeout=900)
 
     print("Creating {function_name} Lambda function", end="")
     progress_bar(5)
@@ -204,5 +273,8 @@ def main():
     bucket_name = 'lecture2-yaqundeng'
     configure_s3_trigger(function_arn, bucket_name)
 
+    # Scheduled reconcile of the running total
+    schedule_reconcile(function_arn, 'S3ObjectSizeReconcile')
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
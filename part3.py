@@ -1,17 +1,19 @@
 import boto3
+import functools
 import time
 import sys
 import logging
 from botocore.exceptions import ClientError
+from aws_config import config
 from part2 import create_function, create_deployment_package
 
 # Set the AWS regioncd
 region = 'us-west-2'
 
 # Initialize AWS clients
-s3_client = boto3.client('s3')
-lambda_client = boto3.client('lambda', region_name=region)
-apigateway_client = boto3.client('apigateway', region_name=region)
+s3_client = boto3.client('s3', config=config)
+lambda_client = boto3.client('lambda', region_name=region, config=config)
+apigateway_client = boto3.client('apigateway', region_name=region, config=config)
 
 # Initialize the logger
 logger = logging.getLogger()
@@ -19,16 +21,19 @@ logger.setLevel(logging.INFO)
 
 def progress_bar(seconds):
     """Shows a simple progress bar in the command window."""
-    for _ in range(seconds):
-        time.sleep(1)
-        print(".", end="")
-        sys.stdout.flush()
-    print()
+    print("." * seconds)
+    sys.stdout.flush()
+    time.sleep(seconds)
+
+@functools.lru_cache(maxsize=1)
+def account_id():
+    """Returns the ID of the AWS account, looked up once with STS."""
+    return boto3.client("sts", config=config).get_caller_identity()["Account"]
 
 def create_api_gateway(lambda_arn, LAMBDA_FUNCTION_NAME, API_NAME, STAGE_NAME):
     try:
         # Get Lambda function ARN
-        logger.info(f"Lambda ARN: {lambda_arn}")
+        logger.info("Lambda ARN: %s", lambda_arn)
 
         # Create API
         api_response = apigateway_client.create_rest_api(
@@ -37,7 +42,7 @@ def create_api_gateway(lambda_arn, LAMBDA_FUNCTION_NAME, API_NAME, STAGE_NAME):
             endpointConfiguration={'types': ['REGIONAL']}
         )
         api_id = api_response['id']
-        logger.info(f"Created API Gateway with ID: {api_id}")
+        logger.info("Created API Gateway with ID: %s", api_id)
 
         # Get Root Resource ID
         resources = apigateway_client.get_resources(restApiId=api_id)
@@ -50,7 +55,7 @@ def create_api_gateway(lambda_arn, LAMBDA_FUNCTION_NAME, API_NAME, STAGE_NAME):
             pathPart='plot'
         )
         resource_id = resource_response['id']
-        logger.info(f"Created resource 'plot' with ID: {resource_id}")
+        logger.info("Created resource 'plot' with ID: %s", resource_id)
 
         # Create Method
         apigateway_client.put_method(
@@ -59,7 +64,7 @@ def create_api_gateway(lambda_arn, LAMBDA_FUNCTION_NAME, API_NAME, STAGE_NAME):
             httpMethod='GET',
             authorizationType='NONE'
         )
-        logger.info(f"Created GET method for resource 'plot'")
+        logger.info("Created GET method for resource 'plot'")
 
         # Link Lambda Function
         apigateway_client.put_integration(
@@ -70,7 +75,7 @@ def create_api_gateway(lambda_arn, LAMBDA_FUNCTION_NAME, API_NAME, STAGE_NAME):
             integrationHttpMethod='POST',
             uri=f'arn:aws:apigateway:{region}:lambda:path/2015-03-31/functions/{lambda_arn}/invocations'
         )
-        logger.info(f"Integrated Lambda function '{LAMBDA_FUNCTION_NAME}' with GET method on resource 'plot'")
+        logger.info("Integrated Lambda function '%s' with GET method on resource 'plot'", LAMBDA_FUNCTION_NAME)
 
         # Grant Permission to API Gateway
         lambda_client.add_permission(
@@ -78,9 +83,9 @@ def create_api_gateway(lambda_arn, LAMBDA_FUNCTION_NAME, API_NAME, STAGE_NAME):
             StatementId='apigateway-invoke',
             Action='lambda:InvokeFunction',
             Principal='apigateway.amazonaws.com',
-            SourceArn=f'arn:aws:execute-api:{region}:{boto3.client("sts").get_caller_identity()["Account"]}:{api_id}/*/GET/plot'
+            SourceArn=f'arn:aws:execute-api:{region}:{account_id()}:{api_id}/*/GET/plot'
         )
-        logger.info(f"Granted API Gateway permission to invoke Lambda function '{LAMBDA_FUNCTION_NAME}'")
+        logger.info("Granted API Gateway permission to invoke Lambda function '%s'", LAMBDA_FUNCTION_NAME)
 
         # Deploy API
         apigateway_client.create_deployment(
@@ -88,11 +93,11 @@ def create_api_gateway(lambda_arn, LAMBDA_FUNCTION_NAME, API_NAME, STAGE_NAME):
             stageName=STAGE_NAME,
             description='Deployment for S3ObjectSizeHistoryAPI'
         )
-        logger.info(f"Deployed API Gateway to stage '{STAGE_NAME}'")
+        logger.info("Deployed API Gateway to stage '%s'", STAGE_NAME)
 
         return f"https://{api_id}.execute-api.{region}.amazonaws.com/{STAGE_NAME}/plot"
     except Exception as e:
-        logger.error(f"Error creating API Gateway: {e}")
+        logger.error("Error creating API Gateway: %s", e)
         raise
 
 def main():
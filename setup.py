@@ -4,21 +4,20 @@ import logging
 import sys
 import time
 from botocore.exceptions import ClientError
+from aws_config import config
 
 # Initialize the logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 # Initialize a session using Amazon IAM
-iam = boto3.client('iam')
+iam = boto3.client('iam', config=config)
 
 def progress_bar(seconds):
     """Shows a simple progress bar in the command window."""
-    for _ in range(seconds):
-        time.sleep(1)
-        print(".", end="")
-        sys.stdout.flush()
-    print()
+    print("." * seconds)
+    sys.stdout.flush()
+    time.sleep(seconds)
 
 def create_user(user_name):
     try:
@@ -93,18 +92,44 @@ def create_inline_policy_for_user(user_name, role_arn):
             PolicyName=policy_name,
             PolicyDocument=policy_document
         )
-        logger.info(f"Created an inline policy for {user_name} that lets the user assume the role.")
+        logger.info("Created an inline policy for %s that lets the user assume the role.", user_name)
     except ClientError as error:
         logger.exception(
-            f"Couldn't create an inline policy for user {user_name}. Here's why: "
-            f"{error.response['Error']['Message']}"
+            "Couldn't create an inline policy for user %s. Here's why: %s",
+            user_name,
+            error.response['Error']['Message']
         )
         raise
 
-def assume_role(role_arn, session_name, access_key_id, secret_access_key):
+def assume_role(role_arn, session_name, access_key_id, secret_access_key, delays=(0.5, 1, 2, 4, 8, 16)):
+    """
+    Assumes the role with the given access key, backing off between attempts
+    while IAM propagates the new user, role and policies.
+
+    :param role_arn: The ARN of the role to assume.
+    :param session_name: The name of the role session.
+    :param access_key_id: The access key ID of the user assuming the role.
+    :param secret_access_key: The secret access key of the user assuming the role.
+    :param delays: The seconds to sleep after each failed attempt.
+    :return: The temporary credentials of the role session.
+    """
     sts_client = boto3.client(
-        "sts", aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key
+        "sts", aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key,
+        config=config
     )
+    for delay in delays:
+        try:
+            response = sts_client.assume_role(
+                RoleArn=role_arn,
+                RoleSessionName=session_name
+            )
+            logger.info("Assumed role %s.", role_arn)
+            return response['Credentials']
+        except ClientError:
+            logger.info("Role %s can't be assumed yet, retrying in %s seconds.", role_arn, delay)
+            time.sleep(delay)
+
+    # Last attempt, let the error propagate if the role still can't be assumed
     try:
         response = sts_client.assume_role(
             RoleArn=role_arn,
@@ -116,22 +141,43 @@ def assume_role(role_arn, session_name, access_key_id, secret_access_key):
         logger.exception("Couldn't assume role %s.", role_arn)
         raise
 
-def create_bucket(bucket_name, region, credentials):
+def create_bucket(bucket_name, region, credentials, delays=(0.5, 1, 2, 4, 8, 16)):
+    """
+    Creates the S3 bucket with the role session credentials, backing off while
+    the role's inline policy isn't in effect yet and S3 denies access.
+
+    :param bucket_name: The name of the bucket.
+    :param region: The region to create the bucket in.
+    :param credentials: The temporary credentials of the role session.
+    :param delays: The seconds to sleep after each denied attempt.
+    """
     s3_client = boto3.client(
         's3',
         region_name=region,
         aws_access_key_id=credentials['AccessKeyId'],
         aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
+        aws_session_token=credentials['SessionToken'],
+        config=config
     )
+    kwargs = {'Bucket': bucket_name}
+    if region != 'us-east-1':
+        kwargs['CreateBucketConfiguration'] = {'LocationConstraint': region}
+
+    for delay in delays:
+        try:
+            s3_client.create_bucket(**kwargs)
+            logger.info("Created bucket %s in region %s.", bucket_name, region)
+            return
+        except ClientError as error:
+            if error.response["Error"]["Code"] != "AccessDenied":
+                logger.exception("Couldn't create bucket %s in region %s.", bucket_name, region)
+                raise
+            logger.info("Access to bucket %s is still denied, retrying in %s seconds.", bucket_name, delay)
+            time.sleep(delay)
+
+    # Last attempt, let the error propagate if access is still denied
     try:
-        if region == 'us-east-1':
-            s3_client.create_bucket(Bucket=bucket_name)
-        else:
-            s3_client.create_bucket(
-                Bucket=bucket_name,
-                CreateBucketConfiguration={'LocationConstraint': region}
-            )
+        s3_client.create_bucket(**kwargs)
         logger.info("Created bucket %s in region %s.", bucket_name, region)
     except ClientError:
         logger.exception("Couldn't create bucket %s in region %s.", bucket_name, region)
@@ -143,7 +189,8 @@ def create_dynamodb_table(table_name, region, credentials):
         region_name=region,
         aws_access_key_id=credentials['AccessKeyId'],
         aws_secret_access_key=credentials['SecretAccessKey'],
-        aws_session_token=credentials['SessionToken']
+        aws_session_token=credentials['SessionToken'],
+        config=config
     )
     try:
         table = dynamodb_client.create_table(
@@ -217,13 +264,7 @@ def main():
         attach_inline_policy(dev_role_name, 'DevS3FullAccess', dev_policy)
         create_inline_policy_for_user(user_name, dev_role["Role"]["Arn"])
 
-    print("Creating dev role", end="")
-    progress_bar(10)
-
-    print("Give AWS time to propagate these new resources and connections.", end="")
-    progress_bar(5)
-
-    # Assume the dev role
+    # Assume the dev role, waiting until it is assumable
     dev_credentials = assume_role(dev_role["Role"]["Arn"], 'ExampleDevSession', access_key_id, secret_access_key)
 
     # Create the S3 bucket